@@ -1,9 +1,23 @@
 import os
+import re
 from dotenv import load_dotenv, find_dotenv
 from fastapi import FastAPI, Header, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-import json
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
 import asyncio
+import logging
+import json_repair
+import orjson
+import functools
+import hmac
+import httpx
+from contextlib import asynccontextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
 # 載入 env
 dotenv_path = find_dotenv()  # or os.path.join(os.path.dirname(__file__), ".env")
@@ -12,15 +26,74 @@ load_dotenv(dotenv_path, override=True)
 # 你原本的 Agent、BrowserContext etc. import
 from browser_use import Agent
 from src.utils import utils
-from browser_use.browser.browser import Browser, BrowserConfig, BrowserContext, BrowserContextConfig
+from src.utils.cache import cache_from_env, cache_key
+from src.utils.browser_pool import BrowserContextPool
+from src.utils.concurrency import SingleFlight, cancel_on_disconnect
+from src.utils.pagination import expand_pagination, max_pages_from_task
+from prompts import (
+    parser_default_message_context,
+    parser_url_message_context,
+    parser_post_message_context,
+    parser_pages_message_context,
+    parser_pagination_links_message_context,
+)
+from browser_use.browser.browser import Browser, BrowserConfig, BrowserContextConfig
 
 # 取 env
 API_TOKEN = os.getenv("API_TOKEN")
+_API_TOKEN_BYTES = (API_TOKEN or "").encode("utf-8")
 AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_KEY      = os.getenv("AZURE_OPENAI_API_KEY")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
+PLANNER_LLM_MODEL = os.getenv("PLANNER_LLM_MODEL", "gpt-4.1-mini")
+PLANNER_LLM_TEMPERATURE = float(os.getenv("PLANNER_LLM_TEMPERATURE", "0.0"))
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+PAGES_MAX_PAGES = int(os.getenv("PAGES_MAX_PAGES", "200"))
+RATE_LIMIT = os.getenv("RATE_LIMIT", "10/minute")
+# HTTP 請求排隊等待 Agent 的秒數上限，逾時回 503；pipeline 內部的子呼叫不受此限
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "30"))
+# 單次 Agent 執行的步數與時間上限
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "40"))
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT_S", "300"))
+# pipeline 第一階段遇到這些狀態（Agent 未完成或失敗）時改由完整 Agent 處理
+FALLBACK_STATUS_CODES = (502, 504)
+AGENT_MAX_INPUT_TOKENS = int(os.getenv("AGENT_MAX_INPUT_TOKENS", "64000"))
+# DOM 只帶入擷取所需的屬性，減少每一步送出的 token
+AGENT_INCLUDE_ATTRIBUTES = ["title", "type", "name", "role", "aria-label", "href"]
+
+# Browser 與 BrowserContext pool 隨每個 worker 的 lifespan 建立與關閉
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.browser = Browser(
+        BrowserConfig(
+            headless=True,
+            disable_security=True,
+        )
+    )
+    await app.state.browser.get_playwright_browser()
+    app.state.pool = BrowserContextPool(
+        browser=app.state.browser,
+        config=context_cfg,
+        size=MAX_CONCURRENT_AGENTS,
+        max_uses=int(os.getenv("MAX_USES_PER_INSTANCE", "50")),
+    )
+    await app.state.pool.prewarm()
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+        await app.state.browser.close()
+        await SHARED_HTTPX.aclose()
 
 # 建立 FastAPI
-app = FastAPI(title="Browser‑use Scraping API")
+app = FastAPI(title="Browser‑use Scraping API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# 每個 client IP 對各 endpoint 的請求頻率限制
+limiter = Limiter(key_func=get_remote_address)
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Body schema
 class ScrapeRequest(BaseModel):
@@ -29,34 +102,35 @@ class ScrapeRequest(BaseModel):
 
 # 取 token 驗證
 def verify_token(x_token: str = Header(..., alias="X-API-Token")):
-    if x_token != API_TOKEN:
+    if not _API_TOKEN_BYTES or not hmac.compare_digest(x_token.encode("utf-8"), _API_TOKEN_BYTES):
         raise HTTPException(status_code=401, detail="Invalid API Token")
     return x_token
 
-# 初始化 LLM & BrowserContext
-llm = utils.get_llm_model(
-    provider="azure_openai",
-    model_name=os.getenv("LLM_MODEL", "gpt-4.1"),
-    temperature=os.getenv("LLM_TEMPERATURE", 0.0),
-    base_url=AZURE_ENDPOINT,
-    api_key=AZURE_KEY,
-    enable_memory=True,
-)
-planner_llm = utils.get_llm_model(
-    provider="azure_openai",
-    model_name=os.getenv("PLANNER_LLM_MODEL", "gpt-4.1-mini"),
-    temperature=os.getenv("PLANNER_LLM_TEMPERATURE", 0.0),
-    base_url=AZURE_ENDPOINT,
-    api_key=AZURE_KEY,
-    enable_memory=True,
+# 所有 LLM 共用同一個 HTTP/2 連線池，避免每次呼叫重新 TLS handshake
+SHARED_HTTPX = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
 )
 
-browser = Browser(
-    BrowserConfig(
-        headless=True,
-        disable_security=True,
+# 初始化 LLM & BrowserContext
+@functools.lru_cache(maxsize=4)
+def get_llm(provider: str, model_name: str, temperature: float, base_url: str):
+    """
+    相同設定只建立一次 LLM handle
+    """
+    return utils.get_llm_model(
+        provider=provider,
+        model_name=model_name,
+        temperature=temperature,
+        base_url=base_url,
+        api_key=AZURE_KEY,
+        enable_memory=True,
+        http_async_client=SHARED_HTTPX,
     )
-)
+
+llm = get_llm("azure_openai", LLM_MODEL, LLM_TEMPERATURE, AZURE_ENDPOINT)
+planner_llm = get_llm("azure_openai", PLANNER_LLM_MODEL, PLANNER_LLM_TEMPERATURE, AZURE_ENDPOINT)
+
 context_cfg = BrowserContextConfig(
     cookies_file="./cookies.json",
     wait_for_network_idle_page_load_time=3.0,
@@ -67,61 +141,18 @@ context_cfg = BrowserContextConfig(
     viewport_expansion=500,
 )
 
-parser_default_message_context = """
-    You are an expert web‑scraping assistant
-    1. 從 task 給予的起始頁面開始，自動翻頁直到沒有「下一頁」為止。
-    2. 在每個列表頁面抓出所有文章項目，並對它們做進入，如果像的 url 是相對路徑時，需把當前的 baseUrl 放入到 url 內以及擷取完整的 url、title、content，再回到列表。
-    3. 以 JSON 陣列形式輸出，每筆記錄包含 { url, title, content }。
-    4. 格式如下 [
-        { "url": "...", "title": "...", "content": "..." },
-        { "url": "...", "title": "...", "content": "..." },
-        …
-        ]
-"""
-
-parser_url_message_context = """
-    You are an expert web‑scraping assistant
-    1. 從給定的起始列表頁，收集頁面中的所有文章項目連結（若為相對路徑請自動拼成完整 URL），只專注在『翻頁＋收集連結』的這件事。.
-    2. output format: [
-        { "url": "...", "title": "..." },
-        { "url": "...", "title": "..." },
-        …
-        ]
-    3. 其餘資料不輸出
-"""
-
-parser_post_message_context = """
-    You are an expert web‑scraping assistant specialized
-    1. 完整擷取網址文章原文，務必不要省略任何段落或字句，不要進行摘要或改寫，完全以原文呈現。
-    2. output format: 
-        { "url": "...", "title": "...", "content": "...", "content_is_omit": true/false }
-    3. content_is_omit: true 代表內容有省略，false 代表內容完整
-    4. 其餘資料不輸出
-"""
-
-parser_pages_message_context = """
-    You are an expert web‑scraping assistant
-    1. 接收使用者提供的「起始頁面 URL」。
-    2. 解析出所有與分頁（pagination）相關的連結
-        a. 例如：下一頁、上一頁、第一頁、最後一頁、分頁數字等。
-        b. 將解析出來的連結記錄下來，供後續使用。
-    3. 透過已知的分頁去取得其餘的所有的分頁（pagination）相關連結
-        a. 使用遞迴且最少頁面跳轉的方式進行分頁解析
-    4. 若連結為相對路徑，自動補全成絕對 URL。
-        a. 紀錄已拜訪的 URL，避免無限迴圈。
-    5. 依據最大分頁數量限制，限制最多解析的分頁數量，並且補齊不完整的分頁連結。
-    6. 將結果包含補齊的分頁連結輸出 JSON 陣列的格式如下：
-        [
-            { "url": "..." },
-            { "url": "..." },
-            …
-        ]
-    7. 如果沒有分頁的話，就提供來源網址的 URL
-        [
-            { "url": "..." }
-        ]
-    8. 其餘資料不輸出
-"""
+# 同時執行的 Agent 數量上限，BrowserContext pool 也以此為大小
+MAX_CONCURRENT_AGENTS = int(os.getenv("MAX_CONCURRENT_AGENTS", "4"))
+# /scrape 同時擷取的文章數，不超過 Agent 上限
+SCRAPE_FANOUT = min(int(os.getenv("SCRAPE_FANOUT", "5")), MAX_CONCURRENT_AGENTS)
+AGENT_SEMAPHORE = asyncio.BoundedSemaphore(MAX_CONCURRENT_AGENTS)
+agent_stats = {"in_flight": 0, "waiting": 0}
+
+# 執行中的 Agent task，key 與 response cache 相同
+INFLIGHT = SingleFlight()
+
+# Agent 回應快取（Redis 或記憶體 LRU）
+cache = cache_from_env()
 
 @app.get("/", summary="Liveness probe")
 async def health() -> dict:
@@ -130,54 +161,299 @@ async def health() -> dict:
     """
     return {"status": "ok"}
 
+@app.get("/metrics", summary="Agent concurrency metrics")
+async def metrics(token: str = Depends(verify_token)) -> dict:
+    """
+    目前執行中與排隊中的 Agent 數量
+    """
+    return {"max_concurrent_agents": MAX_CONCURRENT_AGENTS, **agent_stats}
+
+def parse_json(text: str):
+    """
+    先以 orjson 解析，LLM 輸出格式不完整時再交給 json_repair
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json_repair.loads(text)
+
+def json_response(content) -> Response:
+    """
+    Agent 已輸出 JSON 字串，直接回傳，不做 json.loads 再序列化
+    """
+    return Response(content=content, media_type="application/json")
+
+async def execute_agent(
+    task: str,
+    message_context: str,
+    llm,
+    planner_llm,
+    pool,
+    queue_timeout: Optional[float] = None
+):
+    # 超過上限的請求在此排隊，不會再多開 BrowserContext；queue_timeout 為 None 時一直等到有空位
+    agent_stats["waiting"] += 1
+    try:
+        await asyncio.wait_for(AGENT_SEMAPHORE.acquire(), timeout=queue_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Too many concurrent agent runs, try again later")
+    finally:
+        agent_stats["waiting"] -= 1
+    agent_stats["in_flight"] += 1
+    try:
+        # 從 pool 取出 Context，用完清除狀態後放回，避免跨請求干擾；
+        # 已取得 permit 時 pool 應有空位，逾時代表 pool 異常，回 503 而不是無限等待
+        try:
+            ctx = await pool.acquire(timeout=AGENT_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="No browser context available, try again later")
+        try:
+            # message_context 以 "Context for the task" 訊息放在 system prompt 之後、task 之前，
+            # 同一 endpoint 的 prompt 前綴固定，可命中 provider 端的 prompt cache；planner 也會看到這段說明
+            agent = Agent(
+                task=task,
+                message_context=message_context,
+                llm=llm,
+                browser_context=ctx,
+                planner_llm=planner_llm,
+                use_vision=False,
+                use_vision_for_planner=False,
+                planner_interval=4,
+                tool_calling_method="function_calling",
+                max_input_tokens=AGENT_MAX_INPUT_TOKENS,
+                include_attributes=AGENT_INCLUDE_ATTRIBUTES,
+            )
+            try:
+                result = await asyncio.wait_for(agent.run(max_steps=AGENT_MAX_STEPS), timeout=AGENT_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="Agent run timed out")
+            # 沒有呼叫 done 時 final_result() 只是最後一個動作的訊息，不能當成結果回傳或快取
+            if not result.is_done():
+                raise HTTPException(status_code=504, detail="Agent did not finish within the step limit")
+            if result.is_successful() is False:
+                raise HTTPException(status_code=502, detail="Agent finished without a successful result")
+            return result.final_result()
+        finally:
+            await pool.reset_and_release(ctx)
+    finally:
+        agent_stats["in_flight"] -= 1
+        AGENT_SEMAPHORE.release()
+
+async def _run_and_cache(
+    path: str,
+    key: str,
+    task: str,
+    message_context: str,
+    llm,
+    planner_llm,
+    pool,
+    queue_timeout: Optional[float] = None,
+    embedding: Optional[list] = None
+):
+    final_result = await execute_agent(task, message_context, llm, planner_llm, pool, queue_timeout)
+    if final_result:
+        await cache.set(key, final_result, ttl=CACHE_TTL)
+        await cache.remember(path, task, key, embedding)
+    return final_result
+
+async def agent_result(
+    path: str,
+    task: str,
+    message_context: str,
+    llm,
+    planner_llm,
+    pool,
+    queue_timeout: Optional[float] = None
+):
+    # 相同 endpoint + task 直接回傳快取，不啟動 browser 與 LLM
+    key = cache_key(path, task, message_context)
+    embedding = None
+    cached = await cache.get(key)
+    if cached is None:
+        # 語意比對時算出的 embedding 沿用到 remember()，不重複計算
+        cached, embedding = await cache.get_similar(path, task)
+    if cached is not None:
+        return cached
+
+    # 相同 key 共用同一個獨立的 Agent task；單一請求斷線不影響其他等待者，
+    # 所有等待者都離開後才取消 Agent
+    return await INFLIGHT.do(
+        key,
+        lambda: _run_and_cache(path, key, task, message_context, llm, planner_llm, pool, queue_timeout, embedding),
+    )
+
 async def run_agent(
+    path: str,
     task: str,
     message_context: str,
     llm,
     planner_llm,
-    browser,
-    context_cfg
+    pool
 ):
-    # 每次呼叫都可以新建 Context，避免跨請求干擾
-    ctx = BrowserContext(browser=browser, config=context_cfg)
+    return json_response(await agent_result(path, task, message_context, llm, planner_llm, pool, AGENT_QUEUE_TIMEOUT))
+
+async def collect_links(task: str):
+    """
+    以 /url Agent 收集文章連結，收集不到時回傳 None
+    """
     try:
-        agent = Agent(
-            task=task,
-            message_context=message_context,
-            llm=llm,
-            browser_context=ctx,
-            planner_llm=planner_llm,
-            use_vision_for_planner=False,
-            planner_interval=4,
-            tool_calling_method="function_calling",
-        )
-        result = await agent.run()
-        return Response(content=result.final_result(), media_type="application/json")
+        result = await agent_result("/url", task, parser_url_message_context, llm, planner_llm, app.state.pool, AGENT_QUEUE_TIMEOUT)
+    except HTTPException as e:
+        # Agent 未完成（502/504）時交給單一 Agent 處理；503 代表滿載，直接回傳
+        if e.status_code not in FALLBACK_STATUS_CODES:
+            raise
+        logger.warning(f"Collecting links failed, falling back: {e.detail}")
+        return None
+    urls = parse_json(result or "[]")
+    if not isinstance(urls, list):
+        return None
+    items = [item for item in urls if isinstance(item, dict) and item.get("url")]
+    return items or None
+
+async def fetch_article(item: dict, task: str, sem: asyncio.Semaphore):
+    """
+    以 /post Agent 擷取單篇文章
+
+    原始 /scrape task 會一併帶入，讓其中的篩選條件、語言、登入提示等說明也套用到單篇擷取。
+    擷取失敗時回傳帶有 error 欄位的記錄，不會從結果中消失。
+    """
+    post_task = f"{item['url']}\n\n原始擷取任務如下，僅作為擷取此網址文章時的參考，不要前往其他頁面：\n{task}"
+    async with sem:
+        try:
+            result = await agent_result("/post", post_task, parser_post_message_context, llm, planner_llm, app.state.pool)
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e) or type(e).__name__
+            logger.warning(f"Skipped article {item['url']}: {error}")
+            return {"url": item["url"], "title": item.get("title", ""), "error": error}
+    post = parse_json(result or "null")
+    if not isinstance(post, dict):
+        logger.warning(f"Skipped article {item['url']}: unparseable agent output")
+        return {"url": item["url"], "title": item.get("title", ""), "error": "Unparseable agent output"}
+    return {
+        "url": post.get("url") or item["url"],
+        "title": post.get("title") or item.get("title", ""),
+        "content": post.get("content", ""),
+    }
+
+async def scrape_articles(items: list, task: str):
+    """
+    平行以 /post 擷取每篇文章，依連結順序回傳 JSON 陣列
+    """
+    sem = asyncio.Semaphore(SCRAPE_FANOUT)
+    results = await asyncio.gather(*[fetch_article(item, task, sem) for item in items])
+    return orjson.dumps(results)
+
+async def stream_articles(items: list, task: str):
+    """
+    與 scrape_articles 相同，但每擷取完一篇就輸出一行 NDJSON；
+    串流開始後發生的錯誤以最後一行 {"error": ...} 告知 client
+    """
+    sem = asyncio.Semaphore(SCRAPE_FANOUT)
+    tasks = [asyncio.create_task(fetch_article(item, task, sem)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield orjson.dumps(await next_done) + b"\n"
+    except Exception as e:
+        logger.exception("Streaming /scrape failed")
+        yield orjson.dumps({"error": str(e) or type(e).__name__}) + b"\n"
     finally:
-        await ctx.close()
-        await browser.close()
+        # client 中斷串流時一併取消尚未完成的擷取
+        for t in tasks:
+            t.cancel()
+
+def ndjson_lines(records):
+    for record in records:
+        yield orjson.dumps(record) + b"\n"
+
+@app.post("/scrape")
+@limiter.limit(RATE_LIMIT)
+async def scrape(
+    payload: ScrapeRequest,
+    request: Request,
+    stream: bool = False,
+    token: str = Depends(verify_token),
+):
+    """
+    先以 /url 收集文章連結，再平行以 /post 擷取每篇文章；stream=true 時以 NDJSON 逐篇輸出
+    """
+    # 收集連結在回應開始前完成，錯誤可以正常的 status code 回傳
+    async with cancel_on_disconnect(request):
+        items = await collect_links(payload.task)
+        if items is None:
+            # 收集不到連結時，退回單一 Agent 翻頁＋擷取
+            result = await agent_result("/scrape", payload.task, parser_default_message_context, llm, planner_llm, app.state.pool)
+            if not stream:
+                return json_response(result)
+            articles = parse_json(result or "[]")
+            return StreamingResponse(
+                ndjson_lines(articles if isinstance(articles, list) else []),
+                media_type="application/x-ndjson",
+            )
+        if not stream:
+            return json_response(await scrape_articles(items, payload.task))
+        # StreamingResponse 會在 client 斷線時自行取消 generator
+        return StreamingResponse(stream_articles(items, payload.task), media_type="application/x-ndjson")
+
+async def pages_pipeline(task: str):
+    """
+    只解析起始頁的分頁連結並推算分頁規則；推算不出來或看不到最後一頁連結時才交給 Agent 逐頁解析
+    """
+    match = re.search(r"https?://\S+", task)
+    if match:
+        start_url = match.group().rstrip(".,;)\"'")
+        try:
+            result = await agent_result("/pages/links", start_url, parser_pagination_links_message_context, llm, planner_llm, app.state.pool, AGENT_QUEUE_TIMEOUT)
+        except HTTPException as e:
+            if e.status_code not in FALLBACK_STATUS_CODES:
+                raise
+            logger.warning(f"Collecting pagination links failed, falling back: {e.detail}")
+            result = None
+        links = parse_json(result or "[]")
+        if isinstance(links, list):
+            links = [link for link in links if isinstance(link, dict) and link.get("url")]
+            urls = [link["url"] for link in links]
+            last_url = next((link["url"] for link in links if link.get("is_last") is True), None)
+            # task 中指定的最大分頁數量優先，但不超過 PAGES_MAX_PAGES
+            max_pages = min(max_pages_from_task(task) or PAGES_MAX_PAGES, PAGES_MAX_PAGES)
+            pages = expand_pagination(start_url, urls, last_url, max_pages=max_pages)
+            if pages:
+                return orjson.dumps([{"url": url} for url in pages])
+    # 已先執行過 /pages/links 時不再排隊逾時
+    queue_timeout = None if match else AGENT_QUEUE_TIMEOUT
+    return await agent_result("/pages", task, parser_pages_message_context, llm, planner_llm, app.state.pool, queue_timeout)
+
+@app.post("/pages")
+@limiter.limit(RATE_LIMIT)
+async def pages(
+    payload: ScrapeRequest,
+    request: Request,
+    token: str = Depends(verify_token),
+):
+    async with cancel_on_disconnect(request):
+        return json_response(await pages_pipeline(payload.task))
 
 def make_endpoint(path: str, message_context: str):
     @app.post(path)
+    @limiter.limit(RATE_LIMIT)
     async def endpoint(
         payload: ScrapeRequest,
+        request: Request,
         token: str = Depends(verify_token),
     ):
-        return await run_agent(
-            task=payload.task,
-            message_context=message_context,
-            llm=llm,
-            planner_llm=planner_llm,
-            browser=browser,
-            context_cfg=context_cfg
-        )
+        async with cancel_on_disconnect(request):
+            return await run_agent(
+                path=path,
+                task=payload.task,
+                message_context=message_context,
+                llm=llm,
+                planner_llm=planner_llm,
+                pool=request.app.state.pool
+            )
     return endpoint
 
-# 依序建立三支路由
-make_endpoint("/scrape", parser_default_message_context)
+# 依序建立其餘路由，/scrape 與 /pages 另由 pipeline 處理
 make_endpoint("/post", parser_post_message_context)
 make_endpoint("/url", parser_url_message_context)
-make_endpoint("/pages", parser_pages_message_context)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+from typing import Optional
+from urllib.parse import urlsplit
+
+from browser_use.browser.browser import Browser, BrowserContext, BrowserContextConfig
+
+
+class BrowserContextPool:
+    """
+    預先建立的 BrowserContext pool
+
+    acquire() 取出一個 context，用完以 reset_and_release() 清除 cookies（再重新載入 cookies_file）、
+    localStorage / IndexedDB 等站台資料並換一個新分頁後放回 pool。同一個
+    context 使用超過 max_uses 次後會關閉並換成新的，避免 Chromium 長時間累積記憶體。
+    建立新 context 失敗時會放回空位（None），下次 acquire() 再重新建立，pool 不會縮小。
+    """
+
+    def __init__(self, browser: Browser, config: BrowserContextConfig, size: int = 4, max_uses: int = 50):
+        self.browser = browser
+        self.config = config
+        self.size = size
+        self.max_uses = max_uses
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self._uses: dict[int, int] = {}
+        # 每個 context 造訪過的 origin，reset 時逐一清除站台資料
+        self._origins: dict[int, set] = {}
+
+    async def prewarm(self):
+        for _ in range(self.size - self._queue.qsize()):
+            self._queue.put_nowait(await self._new_context())
+
+    async def acquire(self, timeout: Optional[float] = None) -> BrowserContext:
+        ctx = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        if ctx is None:
+            try:
+                ctx = await self._new_context()
+            except BaseException:
+                self._queue.put_nowait(None)
+                raise
+        return ctx
+
+    async def reset_and_release(self, ctx: BrowserContext):
+        self._uses[id(ctx)] = self._uses.get(id(ctx), 0) + 1
+        try:
+            if self._uses[id(ctx)] >= self.max_uses:
+                ctx = await self._replace(ctx)
+            else:
+                try:
+                    await self._reset(ctx)
+                except Exception:
+                    ctx = await self._replace(ctx)
+        except BaseException as e:
+            self._forget(ctx)
+            self._queue.put_nowait(None)
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._queue.put_nowait(ctx)
+
+    async def close(self):
+        while not self._queue.empty():
+            ctx = self._queue.get_nowait()
+            if ctx is not None:
+                self._forget(ctx)
+                await ctx.close()
+
+    async def _new_context(self) -> BrowserContext:
+        ctx = BrowserContext(browser=self.browser, config=self.config)
+        session = await ctx.get_session()
+        self._uses[id(ctx)] = 0
+        self._track_origins(ctx, session.context)
+        return ctx
+
+    async def _replace(self, ctx: BrowserContext) -> BrowserContext:
+        self._forget(ctx)
+        try:
+            await ctx.close()
+        except Exception:
+            pass
+        return await self._new_context()
+
+    def _forget(self, ctx: BrowserContext):
+        self._uses.pop(id(ctx), None)
+        self._origins.pop(id(ctx), None)
+
+    def _track_origins(self, ctx: BrowserContext, context):
+        origins = self._origins.setdefault(id(ctx), set())
+
+        def on_frame(frame):
+            parts = urlsplit(frame.url)
+            if parts.scheme in ("http", "https"):
+                origins.add(f"{parts.scheme}://{parts.netloc}")
+
+        def on_page(page):
+            page.on("framenavigated", on_frame)
+
+        for page in context.pages:
+            on_page(page)
+        context.on("page", on_page)
+
+    async def _reset(self, ctx: BrowserContext):
+        session = await ctx.get_session()
+        context = session.context
+        # 開新分頁再關閉舊分頁，sessionStorage 隨舊分頁一併清除
+        page = await context.new_page()
+        origins = self._origins.get(id(ctx), set())
+        if origins:
+            cdp = await context.new_cdp_session(page)
+            for origin in list(origins):
+                await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            await cdp.detach()
+            origins.clear()
+        # 清除後重新載入 cookies_file 的 cookies（登入資訊等），與新建立的 context 相同
+        await context.clear_cookies()
+        cookies = self._configured_cookies()
+        if cookies:
+            await context.add_cookies(cookies)
+        for old_page in context.pages:
+            if old_page is not page:
+                await old_page.close()
+
+    def _configured_cookies(self) -> list:
+        cookies_file = self.config.cookies_file
+        if not cookies_file or not os.path.exists(cookies_file):
+            return []
+        with open(cookies_file, "r") as f:
+            cookies = json.load(f)
+        for cookie in cookies:
+            if cookie.get("sameSite") not in ("Strict", "Lax", "None"):
+                cookie["sameSite"] = "None"
+        return cookies
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import OrderedDict, deque
+from typing import Optional
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # redis 為選配，未安裝時使用記憶體 LRU
+    aioredis = None
+    RedisError = ()
+
+logger = logging.getLogger(__name__)
+
+_URL = re.compile(r"https?://\S+")
+
+
+def cache_key(path: str, task: str, message_context: str) -> str:
+    """
+    依 endpoint + task + message_context 產生穩定的 cache key
+    """
+    raw = json.dumps({"path": path, "task": task, "ctx": message_context}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _MemoryLRU:
+    """In-process LRU fallback, honouring per-entry TTL."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < asyncio.get_running_loop().time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._data[key] = (asyncio.get_running_loop().time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class LLMCache:
+    """
+    Agent 回應快取
+
+    有設定 REDIS_URL 時使用 Redis，否則使用記憶體 LRU。
+    若設定 CACHE_SEMANTIC_MODEL（sentence-transformers 模型名稱），
+    exact match 未命中時會再以 task 的 embedding 做 cosine 相似度比對。
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        redis_timeout: float = 0.5,
+        maxsize: int = 256,
+        semantic_model: Optional[str] = None,
+        semantic_threshold: float = 0.92,
+    ):
+        if redis_url and aioredis is not None:
+            self._backend = aioredis.from_url(
+                redis_url,
+                decode_responses=True,
+                socket_timeout=redis_timeout,
+                socket_connect_timeout=redis_timeout,
+            )
+        else:
+            self._backend = _MemoryLRU(maxsize)
+        self._semantic_model_name = semantic_model
+        self._semantic_model = None
+        self.semantic_threshold = semantic_threshold
+        # (scope, task 中的 URL, embedding, key)，只保留最近的 maxsize 筆
+        self._recent: deque = deque(maxlen=maxsize)
+
+    async def get(self, key: str) -> Optional[str]:
+        # 快取失效時視為 miss，不影響 endpoint
+        try:
+            return await self._backend.get(key)
+        except RedisError as e:
+            logger.warning(f"Cache get failed, treating as miss: {e}")
+            return None
+
+    async def set(self, key: str, value: str, ttl: int = 3600):
+        try:
+            if isinstance(self._backend, _MemoryLRU):
+                await self._backend.set(key, value, ttl)
+            else:
+                await self._backend.set(key, value, ex=ttl)
+        except RedisError as e:
+            logger.warning(f"Cache set failed, skipping: {e}")
+
+    async def get_similar(self, scope: str, task: str) -> tuple:
+        """
+        在同一個 scope（endpoint + message_context）內，找出語意最接近的已快取 task
+
+        只比對含有完全相同 URL 的 task，避免只差在文章 ID 的網址被誤判為同一篇。
+        回傳的 embedding 可直接傳給 remember()，miss 時不必再計算一次。
+
+        :return: (快取內容或 None, task 的 embedding 或 None)
+        """
+        if not self._semantic_model_name or _is_bare_url(task):
+            return None, None
+        embedding = await self._embed(task)
+        if embedding is None or not self._recent:
+            return None, embedding
+        urls = _urls(task)
+        entries = [
+            (entry_embedding, entry_key)
+            for entry_scope, entry_urls, entry_embedding, entry_key in list(self._recent)
+            if entry_scope == scope and entry_urls == urls
+        ]
+        if not entries:
+            return None, embedding
+        # cosine 計算量隨快取筆數增加，移到 thread 避免阻塞 event loop
+        best_key = await asyncio.to_thread(_best_match, embedding, entries, self.semantic_threshold)
+        if best_key is None:
+            return None, embedding
+        return await self.get(best_key), embedding
+
+    async def remember(self, scope: str, task: str, key: str, embedding: Optional[list] = None):
+        """
+        記錄 task 的 embedding 供 get_similar 使用
+
+        :param embedding: get_similar() 已算好的 embedding；未提供時才重新計算
+        """
+        if not self._semantic_model_name or _is_bare_url(task):
+            return
+        if embedding is None:
+            embedding = await self._embed(task)
+        if embedding is not None:
+            self._recent.append((scope, _urls(task), embedding, key))
+
+    async def _embed(self, task: str):
+        if self._semantic_model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                self._semantic_model_name = None
+                return None
+            self._semantic_model = await asyncio.to_thread(SentenceTransformer, self._semantic_model_name)
+        vector = await asyncio.to_thread(self._semantic_model.encode, task)
+        return [float(x) for x in vector]
+
+
+def _urls(task: str) -> frozenset:
+    return frozenset(_URL.findall(task))
+
+
+def _is_bare_url(task: str) -> bool:
+    # 只有網址的 task（例如 /post）只做 exact match
+    return not _URL.sub("", task).strip()
+
+
+def _best_match(embedding, entries, threshold: float) -> Optional[str]:
+    best_key, best_score = None, threshold
+    for entry_embedding, entry_key in entries:
+        score = _cosine(embedding, entry_embedding)
+        if score >= best_score:
+            best_key, best_score = entry_key, score
+    return best_key
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def cache_from_env() -> LLMCache:
+    return LLMCache(
+        redis_url=os.getenv("REDIS_URL"),
+        redis_timeout=float(os.getenv("CACHE_REDIS_TIMEOUT", "0.5")),
+        maxsize=int(os.getenv("CACHE_MAXSIZE", "256")),
+        semantic_model=os.getenv("CACHE_SEMANTIC_MODEL") or None,
+        semantic_threshold=float(os.getenv("CACHE_SEMANTIC_THRESHOLD", "0.92")),
+    )
@@ -0,0 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(request, interval: float = 0.2):
+    """
+    client 斷線時取消目前的 request task
+
+    取消會以 CancelledError 從 async with 區塊中拋出，handler 不會繼續執行，
+    交由 Starlette 丟棄已斷線的請求。
+    """
+    task = asyncio.current_task()
+
+    async def poll():
+        while not await request.is_disconnected():
+            await asyncio.sleep(interval)
+        task.cancel()
+
+    poller = asyncio.create_task(poll())
+    try:
+        yield
+    finally:
+        poller.cancel()
+
+
+class SingleFlight:
+    """
+    相同 key 的呼叫共用同一個執行中的 task
+
+    task 與呼叫端分離：單一呼叫端被取消（例如 client 斷線）只會停止它自己的等待，
+    其他呼叫端仍會拿到結果；所有呼叫端都離開後才取消 task。
+    """
+
+    def __init__(self):
+        self._runs: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._runs
+
+    async def do(self, key: str, factory):
+        """
+        :param key: 去重用的 key
+        :param factory: 沒有執行中的 task 時呼叫，回傳要執行的 coroutine
+        """
+        run = self._runs.get(key)
+        if run is None:
+            run = asyncio.create_task(factory())
+            self._runs[key] = run
+            self._waiters[run] = 0
+            run.add_done_callback(lambda t: self._runs.pop(key, None) if self._runs.get(key) is t else None)
+        self._waiters[run] += 1
+        try:
+            return await asyncio.shield(run)
+        finally:
+            self._waiters[run] -= 1
+            if not self._waiters[run]:
+                del self._waiters[run]
+                if not run.done():
+                    run.cancel()
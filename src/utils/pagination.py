@@ -0,0 +1,146 @@
+import re
+from functools import reduce
+from math import gcd
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+_DIGITS = re.compile(r"\d+")
+
+# 常見的分頁參數名稱：頁碼與以 offset 表示的分頁
+_PAGE_PARAMS = {"page", "p", "pg", "pn", "paged", "pageno", "page_no", "pagenum", "pageindex", "page_index"}
+_OFFSET_PARAMS = {"start", "offset", "from", "skip"}
+_PAGE_PATH_PREFIX = re.compile(r"(?:page|pg|p)[/_=-]?$", re.IGNORECASE)
+
+_TASK_MAX_PAGES = [
+    re.compile(r"最多\D{0,4}?(\d+)\s*(?:個)?\s*(?:分)?頁"),
+    re.compile(r"(?:前|共)\s*(\d+)\s*頁"),
+    re.compile(r"最大分頁(?:數量?)?(?:限制)?\s*[:：為是=]?\s*(\d+)"),
+    re.compile(r"(?:max(?:imum)?|up\s+to|first)\s*(\d+)\s*pages?", re.IGNORECASE),
+    re.compile(r"max(?:imum)?[\s_-]*pages?\s*[:=]?\s*(\d+)", re.IGNORECASE),
+]
+
+
+def _templates(url: str):
+    """
+    列出 url 中每一個數字位置對應的 (template, 數值, 種類)，template 以 {} 取代該數字，
+    種類為 "page"（頁碼）、"offset"（位移量）或 None（看不出是分頁參數）
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for i, (name, value) in enumerate(query):
+        if value.isdigit():
+            templated = query[:i] + [(name, "{}")] + query[i + 1:]
+            new_query = urlencode(templated, safe="{}")
+            template = urlunsplit((parts.scheme, parts.netloc, parts.path, new_query, ""))
+            yield template, int(value), _param_kind(name)
+    for match in _DIGITS.finditer(parts.path):
+        path = parts.path[:match.start()] + "{}" + parts.path[match.end():]
+        template = urlunsplit((parts.scheme, parts.netloc, path, parts.query, ""))
+        kind = "page" if _PAGE_PATH_PREFIX.search(parts.path[:match.start()]) else None
+        yield template, int(match.group()), kind
+
+
+def _param_kind(name: str) -> Optional[str]:
+    name = name.lower()
+    if name in _PAGE_PARAMS:
+        return "page"
+    if name in _OFFSET_PARAMS:
+        return "offset"
+    return None
+
+
+def max_pages_from_task(task: str) -> Optional[int]:
+    """
+    取出 task 中使用者指定的最大分頁數量，例如「最多 10 頁」、「max 5 pages」
+
+    :return: 分頁數量；未指定時回傳 None
+    """
+    for pattern in _TASK_MAX_PAGES:
+        match = pattern.search(task)
+        if match and int(match.group(1)) > 0:
+            return int(match.group(1))
+    return None
+
+
+def expand_pagination(
+    start_url: str,
+    links: List[str],
+    last_url: Optional[str],
+    max_pages: int = 200,
+) -> Optional[List[str]]:
+    """
+    由起始頁上的分頁連結推算分頁 URL 規則，直接產生所有分頁
+
+    頁碼分頁視為連續頁碼；offset 分頁（?start=20,40,60）的間距取自所有差值的最大公因數。
+    起始頁本身不帶頁碼時視為第一頁。最後一頁以 last_url 為準，沒有最後一頁連結時
+    （例如只顯示 1 2 3 4 5 下一頁 的分頁列）無法得知總頁數，回傳 None。
+
+    :param start_url: 起始頁面 URL
+    :param links: 起始頁上找到的分頁連結（可為相對路徑）
+    :param last_url: 指向最後一頁的連結
+    :param max_pages: 最多產生的分頁數量
+    :return: 分頁 URL 列表；找不到規則時回傳 None
+    """
+    if not last_url:
+        return None
+    last_values = {template: value for template, value, _ in _templates(urljoin(start_url, last_url))}
+
+    seen = {}
+    kinds = {}
+    for link in list(links) + [last_url]:
+        for template, value, kind in _templates(urljoin(start_url, link)):
+            seen.setdefault(template, set()).add(value)
+            kinds[template] = kind
+    start_values = {template: value for template, value, _ in _templates(start_url)}
+    for template, value in start_values.items():
+        if template in seen:
+            seen[template].add(value)
+
+    # 至少要有兩個不同頁碼，且最後一頁連結也帶有此頁碼，才能確定是分頁參數；
+    # 連結中有分頁參數時只採用分頁參數
+    candidates = [
+        (kinds[template] is not None, len(values), template)
+        for template, values in seen.items()
+        if len(values) >= 2 and template in last_values
+    ]
+    if any(kinds.values()):
+        candidates = [candidate for candidate in candidates if candidate[0]]
+    candidates = [candidate for candidate in candidates if candidate[0] or _looks_like_page_numbers(
+        seen[candidate[2]], last_values[candidate[2]]
+    )]
+    if not candidates:
+        return None
+    _, _, template = max(candidates)
+    last_page = last_values[template]
+    values = sorted(v for v in seen[template] if v <= last_page)
+
+    if kinds[template] == "offset":
+        # 起始頁不帶 offset 時即為 offset 0
+        if template not in start_values:
+            values = sorted(set(values) | {0})
+        step = reduce(gcd, (b - a for a, b in zip(values, values[1:])))
+        first_page = values[0] % step
+    else:
+        step = 1
+        first_page = min(values[0], 1)
+
+    if template in start_values:
+        pages = []
+    else:
+        pages = [start_url]
+        first_page += step
+
+    for n in range(first_page, last_page + 1, step):
+        if len(pages) >= max_pages:
+            break
+        pages.append(template.replace("{}", str(n), 1))
+    return pages
+
+
+def _looks_like_page_numbers(values: set, last_page: int) -> bool:
+    """
+    看不出是分頁參數的數字（例如 /list_2.html）只在頁碼從第一頁附近開始且連續時採用，
+    避免把 /news/1234 這類文章 ID 當成頁碼
+    """
+    numbers = sorted(v for v in values if v < last_page)
+    return bool(numbers) and numbers[0] <= 3 and all(b - a == 1 for a, b in zip(numbers, numbers[1:]))
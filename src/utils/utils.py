@@ -83,6 +83,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            http_async_client=kwargs.get("http_async_client"),
         )
     elif provider == "deepseek":
         if not kwargs.get("base_url", ""):
@@ -143,6 +144,7 @@ def get_llm_model(provider: str, **kwargs):
             api_version=api_version,
             azure_endpoint=base_url,
             api_key=api_key,
+            http_async_client=kwargs.get("http_async_client"),
         )
     elif provider == "alibaba":
         if not kwargs.get("base_url", ""):
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from src.utils import cache as cache_module
+from src.utils.cache import LLMCache, _MemoryLRU
+
+
+class FakeRedisError(Exception):
+    pass
+
+
+class BrokenBackend:
+    async def get(self, key):
+        raise FakeRedisError("connection refused")
+
+    async def set(self, key, value, ex=None):
+        raise FakeRedisError("connection refused")
+
+
+def semantic_cache(vectors):
+    """LLMCache，_embed 以固定的向量表取代 sentence-transformers"""
+    cache = LLMCache(semantic_model="fake-model")
+    calls = []
+
+    async def embed(task):
+        calls.append(task)
+        return vectors[task]
+
+    cache._embed = embed
+    return cache, calls
+
+
+class MemoryLRUTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_entry_expires_after_ttl(self):
+        lru = _MemoryLRU()
+        await lru.set("key", "value", ttl=0)
+        await asyncio.sleep(0.01)
+        self.assertIsNone(await lru.get("key"))
+        self.assertNotIn("key", lru._data)
+
+    async def test_entry_within_ttl(self):
+        lru = _MemoryLRU()
+        await lru.set("key", "value", ttl=60)
+        self.assertEqual(await lru.get("key"), "value")
+
+    async def test_evicts_least_recently_used(self):
+        lru = _MemoryLRU(maxsize=2)
+        await lru.set("a", "1", ttl=60)
+        await lru.set("b", "2", ttl=60)
+        await lru.get("a")
+        await lru.set("c", "3", ttl=60)
+        self.assertEqual(await lru.get("a"), "1")
+        self.assertIsNone(await lru.get("b"))
+        self.assertEqual(await lru.get("c"), "3")
+
+
+class BackendErrorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redis_error_is_a_miss(self):
+        cache = LLMCache()
+        cache._backend = BrokenBackend()
+        with mock.patch.object(cache_module, "RedisError", FakeRedisError), self.assertLogs(cache_module.logger):
+            self.assertIsNone(await cache.get("key"))
+            await cache.set("key", "value")
+
+
+class SimilarTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_matches_only_tasks_with_same_urls(self):
+        cache, _ = semantic_cache({
+            "summarize https://a.com/1": [1.0, 0.0],
+            "summarise https://a.com/1": [0.99, 0.01],
+            "summarise https://a.com/2": [0.99, 0.01],
+        })
+        await cache.set("k1", "cached")
+        await cache.remember("/url", "summarize https://a.com/1", "k1")
+
+        cached, _ = await cache.get_similar("/url", "summarise https://a.com/1")
+        self.assertEqual(cached, "cached")
+        cached, _ = await cache.get_similar("/url", "summarise https://a.com/2")
+        self.assertIsNone(cached)
+        cached, _ = await cache.get_similar("/pages", "summarise https://a.com/1")
+        self.assertIsNone(cached)
+
+    async def test_below_threshold_is_a_miss(self):
+        cache, _ = semantic_cache({
+            "list posts https://a.com": [1.0, 0.0],
+            "count images https://a.com": [0.0, 1.0],
+        })
+        await cache.set("k1", "cached")
+        await cache.remember("/url", "list posts https://a.com", "k1")
+        cached, _ = await cache.get_similar("/url", "count images https://a.com")
+        self.assertIsNone(cached)
+
+    async def test_bare_url_is_exact_match_only(self):
+        cache, calls = semantic_cache({})
+        self.assertEqual(await cache.get_similar("/post", "https://a.com/1"), (None, None))
+        await cache.remember("/post", "https://a.com/1", "k1")
+        self.assertEqual(calls, [])
+        self.assertEqual(len(cache._recent), 0)
+
+    async def test_embedding_computed_once_per_miss(self):
+        task = "summarize https://a.com/1"
+        cache, calls = semantic_cache({task: [1.0, 0.0]})
+        cached, embedding = await cache.get_similar("/url", task)
+        self.assertIsNone(cached)
+        await cache.remember("/url", task, "k1", embedding)
+        self.assertEqual(calls, [task])
+        self.assertEqual(len(cache._recent), 1)
+
+    async def test_disabled_without_model(self):
+        cache = LLMCache()
+        self.assertEqual(await cache.get_similar("/url", "summarize https://a.com/1"), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
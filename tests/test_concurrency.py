@@ -0,0 +1,127 @@
+import asyncio
+import unittest
+
+from src.utils.concurrency import SingleFlight, cancel_on_disconnect
+
+
+class FakeRequest:
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class CancelOnDisconnectTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_completes_when_connected(self):
+        request = FakeRequest()
+        async with cancel_on_disconnect(request, interval=0.01):
+            result = await asyncio.sleep(0.03, result="done")
+        self.assertEqual(result, "done")
+
+    async def test_disconnect_cancels_handler_without_resuming(self):
+        request = FakeRequest()
+        resumed = []
+
+        async def handler():
+            async with cancel_on_disconnect(request, interval=0.01):
+                items = await asyncio.sleep(10, result=["item"])
+            resumed.append(items)
+            return items
+
+        task = asyncio.create_task(handler())
+        await asyncio.sleep(0.02)
+        request.disconnected = True
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(resumed, [])
+
+
+class StubAgent:
+    """execute_agent 的替身，記錄執行次數與是否被取消"""
+
+    def __init__(self, result="result", delay=0.05):
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = False
+
+    async def execute_agent(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.result
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_callers_share_one_run(self):
+        flight, agent = SingleFlight(), StubAgent()
+        results = await asyncio.gather(
+            flight.do("key", agent.execute_agent),
+            flight.do("key", agent.execute_agent),
+        )
+        self.assertEqual(results, ["result", "result"])
+        self.assertEqual(agent.calls, 1)
+        self.assertNotIn("key", flight)
+
+    async def test_follower_gets_result_when_leader_is_cancelled(self):
+        flight, agent = SingleFlight(), StubAgent()
+        leader = asyncio.create_task(flight.do("key", agent.execute_agent))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", agent.execute_agent))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        self.assertEqual(await follower, "result")
+        self.assertTrue(leader.cancelled())
+        self.assertFalse(agent.cancelled)
+        self.assertEqual(agent.calls, 1)
+
+    async def test_run_is_cancelled_when_last_waiter_leaves(self):
+        flight, agent = SingleFlight(), StubAgent(delay=10)
+        first = asyncio.create_task(flight.do("key", agent.execute_agent))
+        second = asyncio.create_task(flight.do("key", agent.execute_agent))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        self.assertFalse(agent.cancelled)
+        second.cancel()
+        await asyncio.sleep(0.01)
+        self.assertTrue(agent.cancelled)
+        self.assertNotIn("key", flight)
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(flight.do("key", failing), flight.do("key", failing), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    async def test_disconnected_client_does_not_affect_other_waiter(self):
+        flight, agent = SingleFlight(), StubAgent()
+        gone, connected = FakeRequest(), FakeRequest()
+
+        async def handler(request):
+            async with cancel_on_disconnect(request, interval=0.005):
+                return await flight.do("key", agent.execute_agent)
+
+        leaving = asyncio.create_task(handler(gone))
+        staying = asyncio.create_task(handler(connected))
+        await asyncio.sleep(0.01)
+        gone.disconnected = True
+        with self.assertRaises(asyncio.CancelledError):
+            await leaving
+        self.assertEqual(await staying, "result")
+        self.assertEqual(agent.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
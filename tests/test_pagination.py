@@ -0,0 +1,97 @@
+import unittest
+
+from src.utils.pagination import expand_pagination, max_pages_from_task
+
+
+class ExpandPaginationTest(unittest.TestCase):
+
+    def test_query_page_numbers(self):
+        pages = expand_pagination("https://x.com/news", ["?page=2", "?page=3"], "/news?page=5")
+        self.assertEqual(pages, [
+            "https://x.com/news",
+            "https://x.com/news?page=2",
+            "https://x.com/news?page=3",
+            "https://x.com/news?page=4",
+            "https://x.com/news?page=5",
+        ])
+
+    def test_path_page_numbers(self):
+        pages = expand_pagination("https://x.com/news/page/1", ["/news/page/2"], "/news/page/4")
+        self.assertEqual(pages, [f"https://x.com/news/page/{n}" for n in range(1, 5)])
+
+    def test_windowed_pager_uses_last_link(self):
+        links = [f"?page={n}" for n in range(2, 6)]
+        pages = expand_pagination("https://x.com/list", links, "?page=50")
+        self.assertEqual(pages, ["https://x.com/list"] + [f"https://x.com/list?page={n}" for n in range(2, 51)])
+
+    def test_windowed_pager_without_last_link_falls_back(self):
+        links = [f"?page={n}" for n in range(2, 6)]
+        self.assertIsNone(expand_pagination("https://x.com/list", links, None))
+
+    def test_offset_pagination_uses_gcd_step(self):
+        pages = expand_pagination("https://x.com/list", ["?start=20", "?start=40"], "?start=60")
+        self.assertEqual(pages, [
+            "https://x.com/list",
+            "https://x.com/list?start=20",
+            "https://x.com/list?start=40",
+            "https://x.com/list?start=60",
+        ])
+
+    def test_offset_pagination_with_next_and_last_only(self):
+        pages = expand_pagination("https://x.com/list", ["?start=20"], "?start=100")
+        self.assertEqual(pages, ["https://x.com/list"] + [f"https://x.com/list?start={n}" for n in range(20, 101, 20)])
+
+    def test_page_numbers_with_next_and_last_only(self):
+        pages = expand_pagination("https://x.com/list", ["?page=2"], "?page=6")
+        self.assertEqual(pages, ["https://x.com/list"] + [f"https://x.com/list?page={n}" for n in range(2, 7)])
+
+    def test_prefers_page_param_over_other_numeric_params(self):
+        links = ["?id=7&page=2", "?id=8", "?id=9"]
+        pages = expand_pagination("https://x.com/list?id=7&page=1", links, "?id=7&page=3")
+        self.assertEqual(pages, [f"https://x.com/list?id=7&page={n}" for n in range(1, 4)])
+
+    def test_constant_page_param_falls_back(self):
+        links = ["?id=8&page=1"]
+        self.assertIsNone(expand_pagination("https://x.com/list?id=7&page=1", links, "?id=9&page=1"))
+
+    def test_start_in_the_middle_keeps_earlier_pages(self):
+        pages = expand_pagination("https://x.com/list?page=5", ["?page=4", "?page=6"], "?page=9")
+        self.assertEqual(pages, [f"https://x.com/list?page={n}" for n in range(1, 10)])
+
+    def test_unknown_numeric_path_accepted_for_small_consecutive_pages(self):
+        pages = expand_pagination("https://x.com/list.html", ["/list_2.html", "/list_3.html"], "/list_5.html")
+        self.assertEqual(pages, ["https://x.com/list.html"] + [f"https://x.com/list_{n}.html" for n in range(2, 6)])
+
+    def test_unknown_numeric_path_rejects_article_ids(self):
+        self.assertIsNone(expand_pagination("https://x.com/news", ["/news/1234"], "/news/1299"))
+        self.assertIsNone(expand_pagination("https://x.com/news", ["/news/1234", "/news/1299"], None))
+
+    def test_max_pages(self):
+        pages = expand_pagination("https://x.com/list", ["?page=2"], "?page=100", max_pages=3)
+        self.assertEqual(pages, [
+            "https://x.com/list",
+            "https://x.com/list?page=2",
+            "https://x.com/list?page=3",
+        ])
+
+    def test_no_pattern(self):
+        self.assertIsNone(expand_pagination("https://x.com/list", ["/about"], "?page=2"))
+
+
+class MaxPagesFromTaskTest(unittest.TestCase):
+
+    def test_chinese_limits(self):
+        self.assertEqual(max_pages_from_task("https://x.com/list 最多 10 頁"), 10)
+        self.assertEqual(max_pages_from_task("只抓前3頁 https://x.com/list"), 3)
+        self.assertEqual(max_pages_from_task("最大分頁數量：5 https://x.com"), 5)
+
+    def test_english_limits(self):
+        self.assertEqual(max_pages_from_task("crawl https://x.com up to 7 pages"), 7)
+        self.assertEqual(max_pages_from_task("max_pages=4 https://x.com"), 4)
+
+    def test_no_limit(self):
+        self.assertIsNone(max_pages_from_task("https://x.com/list?page=2"))
+
+
+if __name__ == "__main__":
+    unittest.main()